@@ -8,12 +8,20 @@ Simple interface to:
 """
 
 import streamlit as st
-import tempfile
-import os
-import json
+import hashlib
+import html
+import math
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-from azure_ocr import analyze_layout_rest
-from enhanced_chunker import EnhancedChunker
+import orjson
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from azure_ocr import analyze_batch
+
+if TYPE_CHECKING:
+    from enhanced_chunker import EnhancedChunker
 
 
 # Page configuration
@@ -24,7 +32,7 @@ st.set_page_config(
 )
 
 # Custom CSS for cleaner look
-st.markdown("""
+_CSS = """
 <style>
     .chunk-card {
         background-color: #f8f9fa;
@@ -61,85 +69,376 @@ st.markdown("""
         text-align: center;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# Emitted on every full run: Streamlit removes elements a run doesn't
+# re-emit, so a once-per-session guard would drop the styles. Fragment
+# reruns (filter, paging, download) don't re-send it.
+st.markdown(_CSS, unsafe_allow_html=True)
+
 
+# Chunker configuration
+MIN_CHUNK_LENGTH = 50
+MAX_CHUNK_LENGTH = 4000
+# Keys the disk cache together with the lengths above. The chunker source
+# is hashed from disk rather than imported, so the empty-state page still
+# skips the import, and editing it invalidates previously cached chunks
+_CHUNKER_SOURCE_HASH = hashlib.sha256(
+    Path(__file__).with_name("enhanced_chunker.py").read_bytes()
+).hexdigest()
+_CHUNKER_KEY = (MIN_CHUNK_LENGTH, MAX_CHUNK_LENGTH, _CHUNKER_SOURCE_HASH)
 
-def process_pdf(pdf_file) -> dict:
+# Chunks rendered per page in the chunk list
+CHUNKS_PER_PAGE = 25
+
+# Card style per content type: (CSS class, emoji, label)
+_TYPE_META = {
+    "table_kv": ("chunk-card kv-chunk", "🔑", "Key-Value Table"),
+    "table": ("chunk-card table-chunk", "📊", "Table"),
+}
+_DEFAULT_TYPE_META = ("chunk-card", "📝", "Text")
+
+_CARD_TEMPLATE = """
+    <div class="{card_class}">
+        <div class="chunk-header">{emoji} Chunk {n}: {label}</div>
+        <div class="chunk-meta">📄 Page {page} | 📁 {section}</div>
+        <div class="chunk-content">{content}</div>
+    </div>
     """
-    Process uploaded PDF through OCR and chunking pipeline.
+
+
+@st.cache_resource(show_spinner=False)
+def get_chunker(min_len: int, max_len: int) -> "EnhancedChunker":
+    """Shared chunker instance, reused across reruns and sessions."""
+    # Imported here so the empty-state page doesn't pay for it
+    from enhanced_chunker import EnhancedChunker
     
-    Returns dict with chunks and metadata.
+    return EnhancedChunker(config={
+        "min_chunk_length": min_len,
+        "max_chunk_length": max_len,
+    })
+
+
+def _strip_source(text: str) -> str:
+    """Remove the "[Source: ...]" header the chunker prepends to chunk text."""
+    head, sep, tail = text.partition("]\n\n")
+    return tail if sep and head.startswith("[Source:") else text
+
+
+class _ResultNotCached(RuntimeError):
+    """Raised when a result is looked up without the data needed to build it."""
+
+
+@st.cache_data(persist="disk", show_spinner=False, max_entries=64)
+def _ocr_result(file_hash: str, _raw_ocr: dict = None) -> dict:
     """
-    # Save uploaded file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(pdf_file.read())
-        tmp_path = tmp.name
+    Azure OCR result for one PDF, cached on disk by the SHA-256 of the file.
     
-    try:
-        # Step 1: Azure OCR
-        with st.spinner("🔍 Extracting text with Azure OCR..."):
-            raw_ocr = analyze_layout_rest(tmp_path)
+    Called with _raw_ocr it stores the result; called without it, it acts
+    as a cache probe. Keyed on the contents alone, so the same PDF uploaded
+    under another name is only re-chunked, not sent to Azure again.
+    """
+    if _raw_ocr is None:
+        raise _ResultNotCached("OCR result is not cached.")
+    return _raw_ocr
+
+
+@st.cache_data(persist="disk", show_spinner=False, max_entries=64)
+def _chunk_document(file_hash: str, filename: str, chunker_key: tuple, _raw_ocr: dict = None) -> dict:
+    """
+    Chunk one PDF's Azure OCR result.
+    
+    Cached on disk by the SHA-256 of the file contents, the filename (which
+    appears in chunk headers) and the chunker settings and source hash
+    (_CHUNKER_KEY). Called without _raw_ocr it acts as a cache probe; the
+    OCR result itself is excluded from the cache key.
+    """
+    if _raw_ocr is None:
+        raise _ResultNotCached("Processed result is no longer cached. Please process the document again.")
+    
+    min_len, max_len, _ = chunker_key
+    chunker = get_chunker(min_len, max_len)
+    chunks = chunker.extract_chunks(_raw_ocr, filename=filename)
+    chunks_data = chunker.to_vectordb_format(chunks)
+    
+    # Strip the source header and escape once here rather than on every
+    # render; <br> keeps blank lines from ending the card's HTML block
+    for c in chunks_data:
+        c["_display_html"] = html.escape(_strip_source(c["text"])).replace("\n", "<br>")
+    
+    return {
+        "success": True,
+        "filename": filename,
+        "file_hash": file_hash,
+        "total_chunks": len(chunks_data),
+        "chunks": chunks_data
+    }
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _load_result(file_hash: str, filename: str, chunker_key: tuple, _raw_ocr: dict = None) -> dict:
+    """
+    Processed result for a document, shared in memory across reruns and sessions.
+    
+    Unlike st.cache_data, this returns the same object on every hit instead
+    of a fresh copy, so reruns and sessions don't each hold their own chunk
+    list. On a miss it falls back to the disk cache, which can rehydrate the
+    result without the OCR data.
+    """
+    return _chunk_document(file_hash, filename, chunker_key, _raw_ocr)
+
+
+def _summarize(result: dict) -> dict:
+    """Small per-document summary kept in session state."""
+    return {
+        "success": True,
+        "filename": result["filename"],
+        "file_hash": result["file_hash"],
+        "total_chunks": result["total_chunks"],
+        "type_counts": _count_types(result["chunks"]),
+    }
+
+
+def process_pdfs(pdf_files: list) -> list:
+    """
+    Process uploaded PDFs through OCR and chunking pipeline.
+    
+    Documents already in the result cache are served from it, and ones whose
+    OCR result is cached are only re-chunked; the rest go to Azure as one
+    batch, with a status entry per document, and each is chunked as soon as
+    its own OCR result arrives.
+    
+    Returns a summary dict per file (filename, file_hash, total_chunks,
+    type_counts), or {"success": False, "error": ...} for failures; the
+    chunks themselves stay in the result cache.
+    """
+    docs = []
+    for pdf_file in pdf_files:
+        # getvalue() returns the upload's bytes object itself; getbuffer()
+        # would first copy it to unshare it from the upload record
+        file_hash = hashlib.sha256(pdf_file.getvalue()).hexdigest()
+        docs.append((pdf_file.name, file_hash, pdf_file))
+    
+    summaries = [None] * len(docs)
+    statuses = {}
+    pending = []
+    
+    def _fail(idx, error):
+        summaries[idx] = {"success": False, "filename": docs[idx][0], "error": str(error)}
+        statuses[idx].update(label=f"❌ {docs[idx][0]}: {error}", state="error")
+    
+    for idx, (filename, file_hash, _) in enumerate(docs):
+        try:
+            summaries[idx] = _summarize(_load_result(file_hash, filename, _CHUNKER_KEY))
+            st.status(f"✅ {filename} (cached)", state="complete")
+            continue
+        except _ResultNotCached:
+            pass
         
-        # Step 2: Enhanced Chunking
-        with st.spinner("📦 Creating enhanced chunks..."):
-            chunker = EnhancedChunker(config={
-                "min_chunk_length": 50,
-                "max_chunk_length": 4000,
-            })
-            chunks = chunker.extract_chunks(raw_ocr, filename=pdf_file.name)
-            chunks_data = chunker.to_vectordb_format(chunks)
+        try:
+            raw_ocr = _ocr_result(file_hash)
+        except _ResultNotCached:
+            pending.append(idx)
+            statuses[idx] = st.status(f"🔍 {filename}: extracting text with Azure OCR...", state="running")
+            continue
         
-        return {
-            "success": True,
-            "filename": pdf_file.name,
-            "total_chunks": len(chunks_data),
-            "chunks": chunks_data
-        }
+        statuses[idx] = st.status(f"📦 {filename}: OCR cached, chunking...", state="running")
+        try:
+            summaries[idx] = _summarize(_load_result(file_hash, filename, _CHUNKER_KEY, _raw_ocr=raw_ocr))
+            statuses[idx].update(label=f"✅ {filename} (cached OCR)", state="complete")
+        except Exception as e:
+            _fail(idx, e)
+    
+    # One Azure job per unique file content; uploads of the same PDF under
+    # different names share its OCR result and are chunked per filename
+    groups = {}
+    for idx in pending:
+        groups.setdefault(docs[idx][1], []).append(idx)
+    batch = list(groups.values())
     
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e)
-        }
+    def _chunk_group(batch_idx, raw_ocr):
+        for idx in batch[batch_idx]:
+            filename, file_hash, _ = docs[idx]
+            try:
+                summaries[idx] = _summarize(_load_result(file_hash, filename, _CHUNKER_KEY, _raw_ocr=raw_ocr))
+                statuses[idx].update(label=f"✅ {filename}", state="complete")
+            except Exception as e:
+                _fail(idx, e)
     
-    finally:
-        # Cleanup temp file
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+    if batch:
+        completed = set()
+        
+        # Chunking runs on a worker thread, so each document is chunked as
+        # soon as its OCR finishes while Azure keeps polling the others. The
+        # shared chunker is warmed there first, while the first OCR job runs
+        with ThreadPoolExecutor(max_workers=1, initializer=add_script_run_ctx,
+                                initargs=(None, get_script_run_ctx())) as pool:
+            pool.submit(get_chunker, MIN_CHUNK_LENGTH, MAX_CHUNK_LENGTH)
+            
+            def _on_ocr_complete(batch_idx, raw_ocr):
+                completed.add(batch_idx)
+                if isinstance(raw_ocr, Exception):
+                    for idx in batch[batch_idx]:
+                        _fail(idx, raw_ocr)
+                    return
+                for idx in batch[batch_idx]:
+                    statuses[idx].update(label=f"📦 {docs[idx][0]}: OCR complete, chunking...")
+                pool.submit(_chunk_group, batch_idx, raw_ocr)
+                # Kept so this content under another filename skips Azure
+                pool.submit(_ocr_result, docs[batch[batch_idx][0]][1], raw_ocr)
+            
+            try:
+                analyze_batch(
+                    # getvalue() returns the buffer's bytes without copying them
+                    [docs[group[0]][2].getvalue() for group in batch],
+                    return_exceptions=True,
+                    on_complete=_on_ocr_complete,
+                )
+            except Exception as e:
+                for batch_idx, group in enumerate(batch):
+                    if batch_idx not in completed:
+                        for idx in group:
+                            _fail(idx, e)
+    
+    return summaries
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _serialize_chunks(file_hash: str, filename: str, _data: dict) -> bytes:
+    """
+    Serialize the download payload once per processed file.
+    
+    Keyed like _load_result: chunk headers and the payload include the
+    filename, so the same PDF under another name serializes differently.
+    """
+    payload = {
+        "success": _data["success"],
+        "filename": _data["filename"],
+        "total_chunks": _data["total_chunks"],
+        # Drop display-only keys so the download matches the chunk schema
+        "chunks": [{"text": c["text"], "metadata": c["metadata"]} for c in _data["chunks"]],
+    }
+    return orjson.dumps(payload, option=orjson.OPT_INDENT_2)
+
+
+def _count_types(chunks: list) -> dict:
+    """Count chunks per content type in a single pass."""
+    return dict(Counter(c["metadata"].get("content_type", "text") for c in chunks))
 
 
 def display_chunk(chunk: dict, index: int):
     """Display a single chunk in a nice card format."""
-    content_type = chunk["metadata"].get("content_type", "text")
-    page = chunk["metadata"].get("page_number", "?")
-    section = chunk["metadata"].get("section", "")
-    
-    # Determine card style based on content type
-    if content_type == "table_kv":
-        card_class = "chunk-card kv-chunk"
-        type_emoji = "🔑"
-        type_label = "Key-Value Table"
-    elif content_type == "table":
-        card_class = "chunk-card table-chunk"
-        type_emoji = "📊"
-        type_label = "Table"
-    else:
-        card_class = "chunk-card"
-        type_emoji = "📝"
-        type_label = "Text"
+    metadata = chunk["metadata"]
+    card_class, type_emoji, type_label = _TYPE_META.get(
+        metadata.get("content_type", "text"), _DEFAULT_TYPE_META
+    )
+    
+    st.markdown(_CARD_TEMPLATE.format_map({
+        "card_class": card_class,
+        "emoji": type_emoji,
+        "n": index + 1,
+        "label": type_label,
+        "page": metadata.get("page_number", "?"),
+        "section": metadata.get("section", ""),
+        # Escaped content without source header, precomputed at ingest
+        "content": chunk["_display_html"],
+    }), unsafe_allow_html=True)
+
+
+@st.fragment
+def _render_chunks(summary: dict):
+    """
+    Render stats, filter, chunk list and download for a processed document.
     
-    # Get content without source header
-    content = chunk["text"]
-    if content.startswith("[Source:"):
-        content = content.split("]\n\n", 1)[-1] if "]\n\n" in content else content
+    Runs as a fragment so interacting with the filter or download button
+    only reruns this block, not the whole script.
+    """
+    try:
+        data = _load_result(summary["file_hash"], summary["filename"], _CHUNKER_KEY)
+    except _ResultNotCached as e:
+        st.warning(f"⚠️ {e}")
+        return
     
-    st.markdown(f"""
-    <div class="{card_class}">
-        <div class="chunk-header">{type_emoji} Chunk {index + 1}: {type_label}</div>
-        <div class="chunk-meta">📄 Page {page} | 📁 {section}</div>
-        <div class="chunk-content">{content}</div>
-    </div>
-    """, unsafe_allow_html=True)
+    # Stats row
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.markdown(f"""
+        <div class="stats-box">
+            <h3>📄 {data['filename']}</h3>
+            <p>Document</p>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    with col2:
+        st.markdown(f"""
+        <div class="stats-box">
+            <h3>{data['total_chunks']}</h3>
+            <p>Total Chunks</p>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    # Chunk type counts, computed once at processing time
+    type_counts = summary["type_counts"]
+    
+    with col3:
+        types_str = " | ".join([f"{k}: {v}" for k, v in type_counts.items()])
+        st.markdown(f"""
+        <div class="stats-box">
+            <h3>📊</h3>
+            <p>{types_str}</p>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    st.markdown("---")
+    
+    # Filter options
+    st.subheader("🔍 View Chunks")
+    
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        filter_type = st.selectbox(
+            "Filter by type",
+            ["All"] + list(type_counts.keys())
+        )
+    
+    # Filter chunks
+    chunks_to_show = data["chunks"]
+    if filter_type != "All":
+        chunks_to_show = [c for c in chunks_to_show if c["metadata"].get("content_type") == filter_type]
+    
+    # Paginate so only one page of expanders is built per rerun
+    page_count = max(1, math.ceil(len(chunks_to_show) / CHUNKS_PER_PAGE))
+    with col2:
+        if page_count > 1:
+            page = st.number_input(
+                f"Page (of {page_count})",
+                min_value=1,
+                max_value=page_count,
+                value=1,
+                key=f"chunk_page_{data['file_hash']}_{data['filename']}_{filter_type}"
+            )
+        else:
+            page = 1
+    
+    start = (page - 1) * CHUNKS_PER_PAGE
+    page_chunks = chunks_to_show[start:start + CHUNKS_PER_PAGE]
+    
+    st.caption(f"Showing {len(page_chunks)} of {len(chunks_to_show)} chunks")
+    
+    # Display chunks
+    for i, chunk in enumerate(page_chunks, start=start):
+        with st.expander(f"Chunk {i + 1}: {chunk['metadata'].get('content_type', 'text').upper()} - Page {chunk['metadata'].get('page_number', '?')}", expanded=False):
+            display_chunk(chunk, i)
+    
+    # Download option
+    st.markdown("---")
+    st.download_button(
+        label="📥 Download Chunks as JSON",
+        data=_serialize_chunks(data["file_hash"], data["filename"], data),
+        file_name=f"{data['filename'].replace('.pdf', '').replace('.PDF', '')}_chunks.json",
+        mime="application/json"
+    )
 
 
 def main():
@@ -150,105 +449,51 @@ def main():
     
     # Sidebar for upload
     with st.sidebar:
-        st.header("📤 Upload PDF")
-        uploaded_file = st.file_uploader(
-            "Choose a PDF file",
+        st.header("📤 Upload PDFs")
+        uploaded_files = st.file_uploader(
+            "Choose PDF files",
             type=["pdf"],
-            help="Upload a PDF document to process"
+            accept_multiple_files=True,
+            help="Upload one or more PDF documents to process"
         )
         
-        if uploaded_file:
-            st.success(f"📎 {uploaded_file.name}")
-            process_btn = st.button("🚀 Process Document", type="primary", use_container_width=True)
+        if uploaded_files:
+            for uploaded_file in uploaded_files:
+                st.success(f"📎 {uploaded_file.name}")
+            label = "🚀 Process Document" if len(uploaded_files) == 1 else f"🚀 Process {len(uploaded_files)} Documents"
+            process_btn = st.button(label, type="primary", use_container_width=True)
         else:
             process_btn = False
             st.info("👆 Upload a PDF to get started")
     
-    # Main content area
-    if "chunks_data" not in st.session_state:
-        st.session_state.chunks_data = None
+    # Main content area; session state holds only a small summary per
+    # document, the chunks are looked up from the shared result cache
+    if "processed_docs" not in st.session_state:
+        st.session_state.processed_docs = []
     
     # Process when button clicked
-    if process_btn and uploaded_file:
-        result = process_pdf(uploaded_file)
+    if process_btn and uploaded_files:
+        results = process_pdfs(uploaded_files)
         
-        if result["success"]:
-            st.session_state.chunks_data = result
-            st.success(f"✅ Successfully processed **{result['filename']}**")
-        else:
-            st.error(f"❌ Error: {result['error']}")
-            st.session_state.chunks_data = None
+        for result in results:
+            if result["success"]:
+                st.success(f"✅ Successfully processed **{result['filename']}**")
+            else:
+                st.error(f"❌ Error processing {result['filename']}: {result['error']}")
+        st.session_state.processed_docs = [r for r in results if r["success"]]
     
     # Display chunks if available
-    if st.session_state.chunks_data:
-        data = st.session_state.chunks_data
-        
-        # Stats row
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.markdown(f"""
-            <div class="stats-box">
-                <h3>📄 {data['filename']}</h3>
-                <p>Document</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown(f"""
-            <div class="stats-box">
-                <h3>{data['total_chunks']}</h3>
-                <p>Total Chunks</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # Count chunk types
-        type_counts = {}
-        for chunk in data["chunks"]:
-            ct = chunk["metadata"].get("content_type", "text")
-            type_counts[ct] = type_counts.get(ct, 0) + 1
-        
-        with col3:
-            types_str = " | ".join([f"{k}: {v}" for k, v in type_counts.items()])
-            st.markdown(f"""
-            <div class="stats-box">
-                <h3>📊</h3>
-                <p>{types_str}</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        st.markdown("---")
-        
-        # Filter options
-        st.subheader("🔍 View Chunks")
-        
-        col1, col2 = st.columns([1, 3])
-        with col1:
-            filter_type = st.selectbox(
-                "Filter by type",
-                ["All"] + list(type_counts.keys())
+    if st.session_state.processed_docs:
+        docs = st.session_state.processed_docs
+        if len(docs) > 1:
+            doc_idx = st.selectbox(
+                "Document",
+                range(len(docs)),
+                format_func=lambda i: docs[i]["filename"]
             )
-        
-        # Filter chunks
-        chunks_to_show = data["chunks"]
-        if filter_type != "All":
-            chunks_to_show = [c for c in chunks_to_show if c["metadata"].get("content_type") == filter_type]
-        
-        st.caption(f"Showing {len(chunks_to_show)} chunks")
-        
-        # Display chunks
-        for i, chunk in enumerate(chunks_to_show):
-            with st.expander(f"Chunk {i + 1}: {chunk['metadata'].get('content_type', 'text').upper()} - Page {chunk['metadata'].get('page_number', '?')}", expanded=False):
-                display_chunk(chunk, i)
-        
-        # Download option
-        st.markdown("---")
-        st.download_button(
-            label="📥 Download Chunks as JSON",
-            data=json.dumps(data, indent=2, ensure_ascii=False),
-            file_name=f"{data['filename'].replace('.pdf', '').replace('.PDF', '')}_chunks.json",
-            mime="application/json"
-        )
+        else:
+            doc_idx = 0
+        _render_chunks(docs[doc_idx])
     
     else:
         # Empty state
@@ -4,13 +4,19 @@ Azure Document Intelligence OCR Module
 Sends PDF to Azure DI Layout Model and returns structured JSON.
 Features:
 - Updated API version (2024-11-30) matching production
-- Robust polling with exponential backoff
+- Robust polling with exponential backoff from a short first wait,
+  honoring Retry-After
 - Handles 429/503 throttling and 404 "not ready" responses
+- Pooled keep-alive HTTP session shared across submit and polls
+- Batch analysis: submit up front, then one shared round-robin poll loop
 """
 
 import os
 import time
-import requests
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+import orjson
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -23,24 +29,55 @@ MODEL_ID = "prebuilt-layout"
 
 # Polling settings
 MAX_POLL_ATTEMPTS = 60
-INITIAL_WAIT_MS = 2000
+INITIAL_WAIT_MS = 250
 MAX_WAIT_MS = 10000
 BACKOFF_MULTIPLIER = 1.2
+# 404 polls aren't counted as attempts, so they keep the old 2s wait
+NOT_READY_WAIT_MS = 2000
+
+# Batch settings
+MAX_CONCURRENT_ANALYSES = 3
+
+
+# Errors that count as a failed poll attempt and are retried (orjson decode
+# errors replace the JSONDecodeError poll.json() raised). _get_session adds
+# requests' exceptions once it has imported requests, before any poll.
+_POLL_ERRORS: tuple = (orjson.JSONDecodeError,)
+
+
+@lru_cache(maxsize=None)
+def _get_session():
+    """
+    Shared HTTP session, created on first use.
+    
+    Submit and every poll reuse the same keep-alive TLS connection instead
+    of opening a new one per request. requests is imported here rather than
+    at module import so the app's first paint doesn't wait on it.
+    """
+    global _POLL_ERRORS
+    import requests
+    from requests.adapters import HTTPAdapter
+    
+    _POLL_ERRORS = (requests.exceptions.RequestException, orjson.JSONDecodeError)
+    
+    session = requests.Session()
+    session.headers.update({"Ocp-Apim-Subscription-Key": KEY})
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0))
+    return session
 
 
-def analyze_layout_rest(file_path: str, max_attempts: int = MAX_POLL_ATTEMPTS) -> dict:
+def submit_analyze(pdf_bytes: bytes) -> str:
     """
-    Send file to Azure Layout model & return RAW JSON response.
+    Submit PDF to Azure Layout model without waiting for the result.
     
     Args:
-        file_path: Path to the PDF file
-        max_attempts: Maximum polling attempts before timeout
+        pdf_bytes: Contents of the PDF file
         
     Returns:
-        dict: Raw Azure DI response with analyzeResult
+        str: Operation URL to poll for the result
         
     Raises:
-        RuntimeError: If credentials missing or analysis fails
+        RuntimeError: If credentials missing or submission fails
     """
     if not ENDPOINT or not KEY:
         raise RuntimeError("Missing Azure credentials. Check .env file.")
@@ -51,23 +88,19 @@ def analyze_layout_rest(file_path: str, max_attempts: int = MAX_POLL_ATTEMPTS) -
         f"{MODEL_ID}:analyze?api-version={API_VERSION}&outputContentFormat=markdown"
     )
 
-    headers = {
-        "Ocp-Apim-Subscription-Key": KEY,
-        "Content-Type": "application/pdf",
-    }
+    headers = {"Content-Type": "application/pdf"}
 
     print(f"\n{'='*60}")
     print("📡 AZURE DOCUMENT INTELLIGENCE")
     print(f"{'='*60}")
     print(f"   API Version: {API_VERSION}")
     print(f"   Model: {MODEL_ID}")
-    print(f"   File: {file_path}")
+    print(f"   Size: {len(pdf_bytes):,} bytes")
     print(f"{'='*60}")
     
     print("\n📤 Submitting analysis request...")
     
-    with open(file_path, "rb") as f:
-        resp = requests.post(analyze_url, headers=headers, data=f)
+    resp = _get_session().post(analyze_url, headers=headers, data=pdf_bytes)
 
     if resp.status_code != 202:
         print(f"❌ Submission failed with status: {resp.status_code}")
@@ -80,59 +113,209 @@ def analyze_layout_rest(file_path: str, max_attempts: int = MAX_POLL_ATTEMPTS) -
     
     operation_id = operation_url.split('/')[-1].split('?')[0]
     print(f"✅ Analysis submitted. Operation ID: {operation_id}")
+    
+    return operation_url
+
+
+def _retry_after_ms(headers, default_ms: Optional[float]) -> Optional[float]:
+    """Read a Retry-After header (in seconds) as milliseconds."""
+    value = headers.get("retry-after")
+    if value is None:
+        return default_ms
+    try:
+        return float(value) * 1000
+    except ValueError:
+        return default_ms
 
+
+def _poll_operation(operation_url: str, attempt: int, max_attempts: int) -> Tuple[Optional[dict], float, bool]:
+    """
+    Poll an analysis operation once.
+    
+    Returns:
+        tuple: (result or None if not finished, ms to wait before the next
+        poll, whether this poll counts as an attempt)
+    """
+    poll = _get_session().get(operation_url)
+    
+    # Handle throttling - don't count as attempt
+    if poll.status_code in [429, 503]:
+        retry_after = _retry_after_ms(poll.headers, 3000)
+        print(f"   ⚠️  Rate limited ({poll.status_code}), waiting {int(retry_after)}ms...")
+        return None, retry_after, False
+    
+    # Handle not ready - don't count as attempt
+    if poll.status_code == 404:
+        print(f"   ⏳ Operation not ready yet, waiting...")
+        return None, NOT_READY_WAIT_MS, False
+    
+    poll.raise_for_status()
+    result = orjson.loads(poll.content)
+    status = result.get("status")
+    
+    if status == "succeeded":
+        print(f"\n✅ Layout extraction complete! (attempt {attempt + 1})")
+        
+        analysis = result.get("analyzeResult", {})
+        print(f"   Content length: {len(analysis.get('content', '')):,} chars")
+        print(f"   Pages: {len(analysis.get('pages', []))}")
+        print(f"   Tables: {len(analysis.get('tables', []))}")
+        print(f"   Paragraphs: {len(analysis.get('paragraphs', []))}")
+        
+        return result, 0, True
+    
+    elif status == "failed":
+        error_msg = result.get("error", {}).get("message", "Unknown error")
+        raise RuntimeError(f"❌ Document analysis failed: {error_msg}")
+    
+    # Still running - wait with exponential backoff, never sooner than the
+    # service's Retry-After hint
+    wait_time = min(INITIAL_WAIT_MS * (BACKOFF_MULTIPLIER ** attempt), MAX_WAIT_MS)
+    wait_time = max(wait_time, _retry_after_ms(poll.headers, 0))
+    print(f"   Attempt {attempt + 1}/{max_attempts}: Status = {status}, waiting {int(wait_time)}ms...")
+    return None, wait_time, True
+
+
+def await_result(operation_url: str, max_attempts: int = MAX_POLL_ATTEMPTS) -> dict:
+    """
+    Poll a submitted analysis until it completes.
+    
+    Args:
+        operation_url: Operation URL returned by submit_analyze
+        max_attempts: Maximum polling attempts before timeout
+        
+    Returns:
+        dict: Raw Azure DI response with analyzeResult
+        
+    Raises:
+        RuntimeError: If analysis fails or polling times out
+    """
     # Poll for results with robust handling
     print("\n⏳ Polling for results...")
     
-    poll_headers = {"Ocp-Apim-Subscription-Key": KEY}
     attempt = 0
     
     while attempt < max_attempts:
         try:
-            poll = requests.get(operation_url, headers=poll_headers)
+            result, wait_time, counted = _poll_operation(operation_url, attempt, max_attempts)
             
-            # Handle throttling - don't count as attempt
-            if poll.status_code in [429, 503]:
-                retry_after = int(poll.headers.get('retry-after', 3)) * 1000
-                print(f"   ⚠️  Rate limited ({poll.status_code}), waiting {retry_after}ms...")
-                time.sleep(retry_after / 1000)
-                continue
-            
-            # Handle not ready - don't count as attempt
-            if poll.status_code == 404:
-                print(f"   ⏳ Operation not ready yet, waiting...")
-                time.sleep(INITIAL_WAIT_MS / 1000)
-                continue
-            
-            poll.raise_for_status()
-            result = poll.json()
-            status = result.get("status")
-            
-            if status == "succeeded":
-                print(f"\n✅ Layout extraction complete! (attempt {attempt + 1})")
-                
-                analysis = result.get("analyzeResult", {})
-                print(f"   Content length: {len(analysis.get('content', '')):,} chars")
-                print(f"   Pages: {len(analysis.get('pages', []))}")
-                print(f"   Tables: {len(analysis.get('tables', []))}")
-                print(f"   Paragraphs: {len(analysis.get('paragraphs', []))}")
-                
+            if result is not None:
                 return result
             
-            elif status == "failed":
-                error_msg = result.get("error", {}).get("message", "Unknown error")
-                raise RuntimeError(f"❌ Document analysis failed: {error_msg}")
-            
-            # Still running - wait with exponential backoff
-            wait_time = min(INITIAL_WAIT_MS * (BACKOFF_MULTIPLIER ** attempt), MAX_WAIT_MS)
-            print(f"   Attempt {attempt + 1}/{max_attempts}: Status = {status}, waiting {int(wait_time)}ms...")
             time.sleep(wait_time / 1000)
-            attempt += 1
+            if counted:
+                attempt += 1
             
-        except requests.exceptions.RequestException as e:
+        except _POLL_ERRORS as e:
             print(f"   ⚠️  Poll attempt {attempt + 1} error: {e}")
             attempt += 1
             if attempt < max_attempts:
                 time.sleep(3)
     
     raise RuntimeError(f"❌ Polling timeout after {max_attempts} attempts")
+
+
+def analyze_layout_rest(pdf_bytes: bytes, max_attempts: int = MAX_POLL_ATTEMPTS) -> dict:
+    """
+    Send PDF to Azure Layout model & return RAW JSON response.
+    
+    Args:
+        pdf_bytes: Contents of the PDF file
+        max_attempts: Maximum polling attempts before timeout
+        
+    Returns:
+        dict: Raw Azure DI response with analyzeResult
+        
+    Raises:
+        RuntimeError: If credentials missing or analysis fails
+    """
+    operation_url = submit_analyze(pdf_bytes)
+    return await_result(operation_url, max_attempts)
+
+
+def analyze_batch(documents: List[bytes], max_concurrency: int = MAX_CONCURRENT_ANALYSES,
+                  return_exceptions: bool = False, max_attempts: int = MAX_POLL_ATTEMPTS,
+                  on_complete: Optional[Callable[[int, object], None]] = None) -> list:
+    """
+    Analyze several PDFs, with at most max_concurrency in flight.
+    
+    PDFs are submitted up front (up to the cap) so Azure processes them in
+    parallel, then a single loop polls only the outstanding operations, each
+    on its own backoff schedule, topping up submissions as operations finish.
+    
+    Args:
+        documents: Contents of the PDF files
+        max_concurrency: Maximum number of simultaneous Azure analyses
+        return_exceptions: If True, a failed document yields its exception in the
+            result list instead of raising
+        max_attempts: Maximum polling attempts per document before timeout
+        on_complete: Called as on_complete(index, result) as each document
+            finishes, from the polling loop's thread; result is the exception
+            for failed documents when return_exceptions is True
+        
+    Returns:
+        list: Raw Azure DI responses, in the same order as documents
+    """
+    results = [None] * len(documents)
+    to_submit = list(range(len(documents)))
+    in_flight = {}  # index -> {"url", "attempt", "next_poll"}
+    
+    def _finish(idx, result):
+        results[idx] = result
+        if on_complete is not None:
+            on_complete(idx, result)
+    
+    def _fail(idx, error):
+        if not return_exceptions:
+            raise error
+        _finish(idx, error)
+    
+    while to_submit or in_flight:
+        # Top up submissions to the concurrency cap
+        while to_submit and len(in_flight) < max_concurrency:
+            idx = to_submit.pop(0)
+            try:
+                operation_url = submit_analyze(documents[idx])
+            except Exception as e:
+                _fail(idx, e)
+                continue
+            in_flight[idx] = {"url": operation_url, "attempt": 0, "next_poll": time.monotonic()}
+        
+        if not in_flight:
+            continue
+        
+        # Sleep until the earliest outstanding operation is due
+        next_due = min(op["next_poll"] for op in in_flight.values())
+        delay = next_due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        
+        now = time.monotonic()
+        for idx, op in list(in_flight.items()):
+            if op["next_poll"] > now:
+                continue
+            
+            try:
+                result, wait_time, counted = _poll_operation(op["url"], op["attempt"], max_attempts)
+            except _POLL_ERRORS as e:
+                print(f"   ⚠️  Poll attempt {op['attempt'] + 1} error: {e}")
+                result, wait_time, counted = None, 3000, True
+            except Exception as e:
+                del in_flight[idx]
+                _fail(idx, e)
+                continue
+            
+            if result is not None:
+                del in_flight[idx]
+                _finish(idx, result)
+                continue
+            
+            if counted:
+                op["attempt"] += 1
+                if op["attempt"] >= max_attempts:
+                    del in_flight[idx]
+                    _fail(idx, RuntimeError(f"❌ Polling timeout after {max_attempts} attempts"))
+                    continue
+            op["next_poll"] = time.monotonic() + wait_time / 1000
+    
+    return results
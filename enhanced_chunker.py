@@ -5,24 +5,53 @@ Implements production-grade chunking strategy:
 1. Dedicated table chunks (KV-table and markdown formats)
 2. Page-based text splitting using <!-- PageBreak -->
 3. Header prefixes for context
-4. Deduplication via content hashing
+4. Deduplication on normalized content
 5. Quality filters for noise removal
 """
 
 import re
-import hashlib
+import sys
+from functools import lru_cache
 from typing import List, Dict, Optional
 from dataclasses import dataclass
 
 
+# Compiled once at import; used per line/chunk in hot paths
+_HTML_TABLE_RE = re.compile(r'<table>.*?</table>', re.DOTALL)
+# A run of markdown table lines (starting with "|" and containing another
+# "|"), plus the blank line that closes the table
+_MD_TABLE_BLOCK_RE = re.compile(r'^(?:[^\S\n]*\|[^\n]*\|[^\n]*\n)+(?:[^\S\n]*\n)?', re.MULTILINE)
+# ASCII bytes that aren't letters; deleting them leaves only the letters
+_ASCII_NON_ALPHA = bytes(b for b in range(128) if not chr(b).isalpha())
+
+
+@lru_cache(maxsize=512)
+def _make_header(filename: str, section: str, page: int) -> str:
+    """Build a chunk's "[Source: ...]" header, cached since inputs repeat."""
+    # Bounded so a long-running app doesn't grow the cache forever
+    return f"[Source: {filename} | {section} | Page {page}]\n\n"
+
+
 @dataclass
 class EnhancedChunk:
-    """Represents a processed chunk with metadata."""
-    content: str
+    """
+    Represents a processed chunk with metadata.
+    
+    The contextual header and the body are kept apart; the length and dedup
+    checks read the body, and the two are only concatenated when content
+    is read.
+    """
     content_type: str  # "table", "table_kv", "text"
     page_number: Optional[int]
     section: Optional[str]
     metadata: Dict
+    header: str  # "[Source: ...]" prefix from _build_header
+    body_content: str
+    
+    @property
+    def content(self) -> str:
+        """Full chunk text: header followed by body."""
+        return self.header + self.body_content
 
 
 class EnhancedChunker:
@@ -50,8 +79,9 @@ class EnhancedChunker:
             r'^\s*$',
             r'^F\d{3,4}\s+\d+\s+\d+$',
         ]
-        
-        self.seen_hashes = set()
+        self._noise_re = re.compile(
+            "|".join(f"(?:{p})" for p in self.noise_patterns), re.IGNORECASE
+        )
     
     def extract_chunks(self, raw_ocr: Dict, filename: str = "document") -> List[EnhancedChunk]:
         """
@@ -67,20 +97,19 @@ class EnhancedChunker:
         analyze_result = raw_ocr.get("analyzeResult", raw_ocr)
         
         content = analyze_result.get("content", "")
-        content_format = analyze_result.get("contentFormat", "text")
+        content_format = analyze_result.get("contentFormat")
         tables = analyze_result.get("tables", [])
         pages = analyze_result.get("pages", [])
         
         print(f"\n{'='*60}")
         print(f"📄 ENHANCED CHUNKER")
         print(f"{'='*60}")
-        print(f"Content format: {content_format}")
+        print(f"Content format: {content_format or 'unspecified'}")
         print(f"Content length: {len(content):,} chars")
         print(f"Tables: {len(tables)}")
         print(f"Pages: {len(pages)}")
         
         chunks = []
-        self.seen_hashes.clear()
         
         # Extract table chunks
         print(f"\n📊 Extracting table chunks...")
@@ -90,7 +119,7 @@ class EnhancedChunker:
         
         # Process text content
         print(f"\n📝 Processing text content (page-based)...")
-        text_chunks = self._process_one_shot(content, filename, pages)
+        text_chunks = self._process_one_shot(content, filename, pages, content_format)
         chunks.extend(text_chunks)
         print(f"   Created {len(text_chunks)} text chunks")
         
@@ -103,21 +132,19 @@ class EnhancedChunker:
         
         return final_chunks
     
-    def _should_collapse_rows(self, grid: List[List], header_rows: set) -> bool:
+    def _should_collapse_rows(self, col0_filled: List[bool], header_rows: set) -> bool:
         """Check if table has continuation rows that should be collapsed."""
-        if not grid or len(grid) < 2:
+        if len(col0_filled) < 2:
             return False
         
         has_parent_row = False
         has_continuation_row = False
         
-        for row_idx, row in enumerate(grid):
+        for row_idx, filled in enumerate(col0_filled):
             if row_idx in header_rows:
                 continue
             
-            col0_value = (row[0] or "").strip() if row else ""
-            
-            if col0_value:
+            if filled:
                 has_parent_row = True
             else:
                 if has_parent_row:
@@ -125,7 +152,8 @@ class EnhancedChunker:
         
         return has_parent_row and has_continuation_row
     
-    def _collapse_rows(self, grid: List[List], header_rows: set, col_count: int) -> List[List]:
+    def _collapse_rows(self, grid: List[List], header_rows: set, col_count: int,
+                       col0_filled: List[bool]) -> List[List]:
         """Collapse continuation rows into their parent rows."""
         if not grid:
             return grid
@@ -144,9 +172,7 @@ class EnhancedChunker:
                 collapsed.append(row)
                 continue
             
-            col0_value = (row[0] or "").strip() if row else ""
-            
-            if col0_value:
+            if col0_filled[row_idx]:
                 if current_parent is not None:
                     merged = self._merge_row_group(current_parent, current_continuations, col_count)
                     collapsed.append(merged)
@@ -167,26 +193,13 @@ class EnhancedChunker:
     
     def _merge_row_group(self, parent: List, continuations: List[List], col_count: int) -> List:
         """Merge a parent row with its continuation rows, column by column."""
-        merged = [None] * col_count
-        
-        for col_idx in range(col_count):
-            values = []
-            
-            parent_val = (parent[col_idx] or "").strip() if col_idx < len(parent) else ""
-            if parent_val:
-                values.append(parent_val)
-            
-            for cont_row in continuations:
-                cont_val = (cont_row[col_idx] or "").strip() if col_idx < len(cont_row) else ""
-                if cont_val:
-                    values.append(cont_val)
-            
-            if len(values) == 0:
-                merged[col_idx] = ""
-            elif len(values) == 1:
-                merged[col_idx] = values[0]
-            else:
-                merged[col_idx] = "; ".join(values)
+        # Cells are stripped strings and "" is empty, so a column's merged
+        # value is just its non-empty cells joined ("" if there are none)
+        rows = [parent, *continuations]
+        merged = [
+            "; ".join([row[col_idx] for row in rows if row[col_idx]])
+            for col_idx in range(col_count)
+        ]
         
         return merged
     
@@ -201,9 +214,12 @@ class EnhancedChunker:
         for row in grid:
             if row[0]:
                 non_empty_rows += 1
-                left_cell = row[0].strip()
+                left_cell = row[0]
                 if len(left_cell) < 40 and len(left_cell.split()) <= 5:
-                    alpha_count = sum(1 for c in left_cell if c.isalpha())
+                    if left_cell.isascii():
+                        alpha_count = len(left_cell.encode("ascii").translate(None, _ASCII_NON_ALPHA))
+                    else:
+                        alpha_count = sum(map(str.isalpha, left_cell))
                     if alpha_count > len(left_cell) * 0.3:
                         label_like_count += 1
         
@@ -213,96 +229,108 @@ class EnhancedChunker:
     
     def _extract_table_chunks(self, tables: List[Dict], filename: str) -> List[EnhancedChunk]:
         """Extract dedicated chunks for each table with smart formatting."""
+        results = [self._process_table(idx, table, filename) for idx, table in enumerate(tables)]
+        
+        return [chunk for table_chunks in results for chunk in table_chunks]
+    
+    def _process_table(self, table_idx: int, table: Dict, filename: str) -> List[EnhancedChunk]:
+        """Build the chunk(s) for a single table."""
         chunks = []
         
-        for table_idx, table in enumerate(tables):
-            row_count = table.get("rowCount", 0)
-            col_count = table.get("columnCount", 0)
-            cells = table.get("cells", [])
-            
-            if not cells:
-                continue
-            
-            bounding_regions = table.get("boundingRegions", [])
-            page_num = bounding_regions[0].get("pageNumber", 1) if bounding_regions else 1
-            
-            # Build grid and detect headers
-            grid = [[None for _ in range(col_count)] for _ in range(row_count)]
-            headers = [None] * col_count
-            header_rows = set()
-            has_explicit_headers = False
-            
-            for cell in cells:
-                row_idx = cell.get("rowIndex", 0)
-                col_idx = cell.get("columnIndex", 0)
-                content = cell.get("content", "").strip()
-                kind = cell.get("kind", "")
-                
-                if row_idx < row_count and col_idx < col_count:
-                    grid[row_idx][col_idx] = content
-                    
-                    if kind == "columnHeader":
-                        headers[col_idx] = content
-                        header_rows.add(row_idx)
-                        has_explicit_headers = True
-            
-            # Collapse continuation rows
-            if self._should_collapse_rows(grid, header_rows):
-                grid = self._collapse_rows(grid, header_rows, col_count)
-                row_count = len(grid)
-            
-            is_kv_table = self._is_kv_table(grid, col_count, row_count)
-            
-            # KV Table format
-            if is_kv_table:
-                kv_pairs = []
-                for row in grid:
-                    label = (row[0] or "").strip().rstrip(':')
-                    value = (row[1] or "").strip()
-                    if label and value:
-                        kv_pairs.append(f"{label}: {value}")
+        row_count = table.get("rowCount", 0)
+        col_count = table.get("columnCount", 0)
+        cells = table.get("cells", [])
+        
+        if not cells:
+            return chunks
+        
+        bounding_regions = table.get("boundingRegions", [])
+        page_num = bounding_regions[0].get("pageNumber", 1) if bounding_regions else 1
+        # Interned: the same labels recur across every processed document
+        section = sys.intern(f"Table {table_idx + 1}")
+        
+        # Build grid and detect headers. Cells are stripped once here, and ""
+        # marks an empty cell, so the helpers below never re-strip
+        grid = [[""] * col_count for _ in range(row_count)]
+        headers = [""] * col_count
+        header_rows = set()
+        has_explicit_headers = False
+        
+        # Pull the four fields out of each cell dict in one pass
+        parsed_cells = [
+            (c.get("rowIndex", 0), c.get("columnIndex", 0), c.get("content", "").strip(), c.get("kind", ""))
+            for c in cells
+        ]
+        
+        for row_idx, col_idx, content, kind in parsed_cells:
+            if row_idx < row_count and col_idx < col_count:
+                grid[row_idx][col_idx] = content
                 
-                if kv_pairs:
-                    kv_content = "\n".join(kv_pairs)
-                    header = self._build_header(
-                        filename=filename,
-                        section=f"Table {table_idx + 1} (Key-Value)",
-                        page=page_num
-                    )
-                    chunks.append(EnhancedChunk(
-                        content=header + kv_content,
-                        content_type="table_kv",
-                        page_number=page_num,
-                        section=f"Table {table_idx + 1}",
-                        metadata={
-                            "table_index": table_idx,
-                            "table_type": "key_value",
-                            "row_count": row_count,
-                            "column_count": col_count
-                        }
-                    ))
-                continue
+                if kind == "columnHeader":
+                    headers[col_idx] = content
+                    header_rows.add(row_idx)
+                    has_explicit_headers = True
+        
+        # Collapse continuation rows (cells are already stripped, so a
+        # non-empty first cell marks a parent row)
+        col0_filled = [bool(row and row[0]) for row in grid]
+        if self._should_collapse_rows(col0_filled, header_rows):
+            grid = self._collapse_rows(grid, header_rows, col_count, col0_filled)
+            row_count = len(grid)
+        
+        is_kv_table = self._is_kv_table(grid, col_count, row_count)
+        
+        # KV Table format
+        if is_kv_table:
+            kv_pairs = [
+                f"{label}: {value}"
+                for label, value in [(row[0].rstrip(':'), row[1]) for row in grid]
+                if label and value
+            ]
             
-            # Regular table format
-            table_markdown = self._table_to_markdown(grid, headers, header_rows, has_explicit_headers, col_count)
-            if table_markdown and len(table_markdown) > 20:
+            if kv_pairs:
+                kv_content = "\n".join(kv_pairs)
                 header = self._build_header(
                     filename=filename,
-                    section=f"Table {table_idx + 1}",
+                    section=f"{section} (Key-Value)",
                     page=page_num
                 )
                 chunks.append(EnhancedChunk(
-                    content=header + table_markdown,
-                    content_type="table",
+                    content_type="table_kv",
                     page_number=page_num,
-                    section=f"Table {table_idx + 1}",
+                    section=section,
                     metadata={
                         "table_index": table_idx,
+                        "table_type": "key_value",
                         "row_count": row_count,
-                        "column_count": col_count,
-                        "headers": [h for h in headers if h] if has_explicit_headers else []
-                    }
+                        "column_count": col_count
+                    },
+                    header=header,
+                    body_content=kv_content
                 ))
+            return chunks
+        
+        # Regular table format
+        table_markdown = self._table_to_markdown(grid, headers, header_rows, has_explicit_headers, col_count)
+        if table_markdown and len(table_markdown) > 20:
+            header = self._build_header(
+                filename=filename,
+                section=section,
+                page=page_num
+            )
+            chunks.append(EnhancedChunk(
+                content_type="table",
+                page_number=page_num,
+                section=section,
+                metadata={
+                    "table_index": table_idx,
+                    "row_count": row_count,
+                    "column_count": col_count,
+                    "headers": [h for h in headers if h] if has_explicit_headers else []
+                },
+                header=header,
+                body_content=table_markdown
+            ))
         
         return chunks
     
@@ -312,35 +340,40 @@ class EnhancedChunker:
         if not grid or not grid[0]:
             return ""
         
-        lines = []
-        
+        # Grid cells are always strings ("" when empty), so rows join directly
         if has_explicit_headers:
-            header_row = " | ".join(h or "" for h in headers)
-            lines.append(f"| {header_row} |")
-            lines.append("|" + "|".join(["---"] * len(headers)) + "|")
-            
-            for row_idx, row in enumerate(grid):
-                if row_idx in header_rows:
-                    continue
-                row_content = " | ".join(cell or "" for cell in row)
-                lines.append(f"| {row_content} |")
-        else:
-            synthetic_headers = [f"Column {i+1}" for i in range(col_count)]
-            header_row = " | ".join(synthetic_headers)
-            lines.append(f"| {header_row} |")
-            lines.append("|" + "|".join(["---"] * col_count) + "|")
-            
-            for row in grid:
-                row_content = " | ".join(cell or "" for cell in row)
-                lines.append(f"| {row_content} |")
-        
+            return self._table_to_markdown_with_headers(grid, headers, header_rows)
+        return self._table_to_markdown_no_headers(grid, col_count)
+    
+    def _table_to_markdown_with_headers(self, grid: List[List], headers: List, header_rows: set) -> str:
+        """Markdown for a table with explicit column headers, skipping header rows."""
+        header_row = " | ".join(headers)
+        lines = [f"| {header_row} |", "|---" * len(headers) + "|"]
+        lines += [
+            f"| {' | '.join(row)} |"
+            for row_idx, row in enumerate(grid)
+            if row_idx not in header_rows
+        ]
         return "\n".join(lines)
     
-    def _process_one_shot(self, content: str, filename: str, pages: List[Dict]) -> List[EnhancedChunk]:
+    def _table_to_markdown_no_headers(self, grid: List[List], col_count: int) -> str:
+        """Markdown for a header-less table: synthetic headers, every row emitted."""
+        header_row = " | ".join([f"Column {i+1}" for i in range(col_count)])
+        separator = "|---" * col_count + "|"
+        body = "\n".join([f"| {' | '.join(row)} |" for row in grid])
+        return f"| {header_row} |\n{separator}\n{body}"
+    
+    def _process_one_shot(self, content: str, filename: str, pages: List[Dict],
+                          content_format: Optional[str] = None) -> List[EnhancedChunk]:
         """Process text content with page-based splitting."""
         chunks = []
         
-        clean_content = self._remove_tables_from_content(content)
+        # Only explicitly plain-text output is known to have no embedded
+        # tables; a missing format is treated as markdown
+        if content_format != "text":
+            clean_content = self._remove_tables_from_content(content)
+        else:
+            clean_content = content
         
         if not clean_content or len(clean_content) < self.min_chunk_length:
             return chunks
@@ -349,113 +382,123 @@ class EnhancedChunker:
         if len(clean_content) <= self.max_chunk_length:
             header = self._build_header(filename=filename, section="Document", page=1)
             chunks.append(EnhancedChunk(
-                content=header + clean_content,
                 content_type="text",
                 page_number=1,
                 section="Document",
-                metadata={"total_pages": len(pages)}
+                metadata={"total_pages": len(pages)},
+                header=header,
+                body_content=clean_content
             ))
             return chunks
         
         # Split by page breaks
-        parts = clean_content.split("<!-- PageBreak -->") if "<!-- PageBreak -->" in clean_content else [clean_content]
+        parts = clean_content.split("<!-- PageBreak -->")
         
         for idx, part in enumerate(parts):
             trimmed = part.strip()
             if len(trimmed) >= self.min_chunk_length:
-                header = self._build_header(filename=filename, section=f"Page {idx + 1}", page=idx + 1)
+                section = sys.intern(f"Page {idx + 1}")
+                header = self._build_header(filename=filename, section=section, page=idx + 1)
                 chunks.append(EnhancedChunk(
-                    content=header + trimmed,
                     content_type="text",
                     page_number=idx + 1,
-                    section=f"Page {idx + 1}",
-                    metadata={}
+                    section=section,
+                    metadata={},
+                    header=header,
+                    body_content=trimmed
                 ))
         
         return chunks
     
     def _remove_tables_from_content(self, content: str) -> str:
         """Remove both HTML and Markdown table blocks from content."""
-        clean = re.sub(r'<table>.*?</table>', '', content, flags=re.DOTALL)
-        
-        lines = clean.split('\n')
-        filtered_lines = []
-        in_table = False
-        
-        for line in lines:
-            stripped = line.strip()
-            is_table_line = (
-                stripped.startswith('|') and '|' in stripped[1:] or
-                re.match(r'^\|[\s\-:|]+\|$', stripped)
-            )
-            
-            if is_table_line:
-                in_table = True
-                continue
-            else:
-                if in_table and stripped == '':
-                    in_table = False
-                    continue
-                in_table = False
-                filtered_lines.append(line)
+        clean = _HTML_TABLE_RE.sub('', content)
         
-        return '\n'.join(filtered_lines)
+        # Terminate the last line so every line matches the same way, then
+        # drop the terminator again
+        clean = _MD_TABLE_BLOCK_RE.sub('', clean + '\n')
+        return clean[:-1] if clean.endswith('\n') else clean
     
     def _build_header(self, filename: str, section: str, page: int) -> str:
         """Build a contextual header prefix for chunks."""
-        return f"[Source: {filename} | {section} | Page {page}]\n\n"
+        return _make_header(filename, section, page)
     
     def _is_noise(self, text: str) -> bool:
         """Check if text matches noise patterns."""
-        for pattern in self.noise_patterns:
-            if re.match(pattern, text.strip(), re.IGNORECASE):
-                return True
-        return False
+        return self._noise_re.match(text.strip()) is not None
     
-    def _get_content_hash(self, text: str) -> str:
-        """Generate hash for deduplication (based on body content only)."""
-        body = text
-        if text.startswith("[Source:"):
-            header_end = text.find("]\n\n")
-            if header_end != -1:
-                body = text[header_end + 3:]
-        
-        hash_input = body if len(body) <= self.content_hash_length else body[:self.content_hash_length]
-        normalized = hash_input.lower().strip()
-        normalized = re.sub(r'\s+', ' ', normalized)
-        return hashlib.md5(normalized.encode()).hexdigest()
+    def _get_dedup_key(self, body: str) -> str:
+        """Normalized leading body text that identifies duplicate chunks."""
+        # Used as the set key directly: str hashing is cached C code, so this
+        # skips a digest per chunk, and exact keys can't collide
+        return " ".join(body[:self.content_hash_length].lower().split())
     
     def _filter_chunks(self, chunks: List[EnhancedChunk]) -> List[EnhancedChunk]:
         """Apply final quality filters and deduplication."""
         filtered = []
+        # Local to the call so one chunker can be shared across threads
+        seen_keys = set()
+        seen_add = seen_keys.add
+        min_length = self.min_chunk_length
         
         for chunk in chunks:
-            if len(chunk.content) < self.min_chunk_length:
+            if len(chunk.header) + len(chunk.body_content) < min_length:
                 continue
             
+            # Noise patterns see the full text, header included
             if self._is_noise(chunk.content):
                 continue
             
-            content_hash = self._get_content_hash(chunk.content)
-            if content_hash in self.seen_hashes:
+            dedup_key = self._get_dedup_key(chunk.body_content)
+            if dedup_key in seen_keys:
                 continue
-            self.seen_hashes.add(content_hash)
+            seen_add(dedup_key)
             
             filtered.append(chunk)
         
         return filtered
     
+    def _chunk_metadata(self, chunk: EnhancedChunk) -> Dict:
+        """Flat metadata dict stored alongside a chunk's text."""
+        return {
+            "content_type": chunk.content_type,
+            "page_number": chunk.page_number,
+            "section": chunk.section,
+            **chunk.metadata
+        }
+    
     def to_vectordb_format(self, chunks: List[EnhancedChunk]) -> List[Dict]:
         """Convert chunks to format ready for vector DB storage or display."""
         return [
             {
                 "text": chunk.content,
-                "metadata": {
-                    "content_type": chunk.content_type,
-                    "page_number": chunk.page_number,
-                    "section": chunk.section,
-                    **chunk.metadata
-                }
+                "metadata": self._chunk_metadata(chunk)
             }
             for chunk in chunks
         ]
+    
+    def to_vectordb_soa(self, chunks: List[EnhancedChunk], id_prefix: str) -> Dict[str, List]:
+        """
+        Convert chunks to parallel lists for bulk vector DB inserts.
+        
+        The keys match Chroma's collection.add(ids=, documents=, metadatas=).
+        Chroma only accepts scalar metadata values, so a table's "headers"
+        list is flattened to a "; "-joined string here.
+        
+        Args:
+            chunks: Chunks from extract_chunks
+            id_prefix: Prefix for the generated ids (e.g. the file hash);
+                must differ per document so ids stay unique
+        """
+        metadatas = []
+        for chunk in chunks:
+            metadata = self._chunk_metadata(chunk)
+            if "headers" in metadata:
+                metadata["headers"] = "; ".join(metadata["headers"])
+            metadatas.append(metadata)
+        
+        return {
+            "ids": [f"{id_prefix}_{i}" for i in range(len(chunks))],
+            "documents": [chunk.content for chunk in chunks],
+            "metadatas": metadatas,
+        }